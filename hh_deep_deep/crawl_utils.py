@@ -1,11 +1,15 @@
+import csv
+from functools import lru_cache
 import json
 import hashlib
 import logging
+import os
 from pathlib import Path
 import math
 import time
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Optional, List, Set
 
+import docker
 import tldextract
 
 
@@ -17,13 +21,42 @@ def get_domain(url):
     return domain.lower()
 
 
+@lru_cache(maxsize=None)
+def docker_client() -> docker.DockerClient:
+    """ Return a docker client shared by all processes: it keeps
+    a connection to the docker daemon instead of forking the docker CLI.
+    API version is negotiated, as the daemon on the host might be older.
+    """
+    return docker.from_env(version='auto')
+
+
 def gen_job_path(id_: str, root: Path) -> Path:
     return root.joinpath('{}_{}'.format(
         int(time.time()),
-        hashlib.md5(id_.encode('utf8')).hexdigest()[:12]
+        hashlib.sha1(id_.encode('utf8')).hexdigest()[:12]
     ))
 
 
+def write_seeds(path: Path, seeds: List[str]) -> None:
+    """ Write seed urls, one per line.
+    """
+    path.write_text('\n'.join(seeds), encoding='utf8')
+
+
+def read_seeds(path: Path) -> List[str]:
+    """ Read seed urls written by write_seeds, or written as csv
+    by older versions.
+    """
+    seeds = []
+    for line in path.read_text('utf8').splitlines():
+        line = line.strip()
+        if line.startswith('"'):  # quoted by csv, urls can't start with '"'
+            line, = next(csv.reader([line]))
+        if line:
+            seeds.append(line)
+    return seeds
+
+
 class CrawlPaths:
     def __init__(self, root: Path):
         root = root.absolute()
@@ -36,6 +69,15 @@ class CrawlPaths:
     def mkdir(self):
         self.root.mkdir(parents=True, exist_ok=True)
 
+    def existing_names(self) -> Set[str]:
+        """ Return names of all files in root: checking paths against them
+        needs just one directory listing instead of a stat for each path.
+        """
+        try:
+            return set(os.listdir(str(self.root)))
+        except FileNotFoundError:
+            return set()
+
 
 class CrawlProcess:
     id_field = 'id'
@@ -72,19 +114,38 @@ class CrawlProcess:
         running = {}
         jobs_root = kwargs['jobs_root']
         logging.info('Loading jobs from {}'.format(jobs_root))
-        if jobs_root.exists():
-            for job_root in sorted(jobs_root.iterdir()):
-                process = cls.load_running(job_root, **kwargs)
-                if process is not None:
-                    old_process = running.get(process.id_)
-                    if old_process is not None:
-                        old_process.stop()
-                    running[process.id_] = process
+        try:
+            entries = list(os.scandir(str(jobs_root)))
+        except FileNotFoundError:
+            return running
+        # DirEntry.is_dir does not need an extra stat on most filesystems
+        job_roots = sorted(Path(e.path) for e in entries if e.is_dir())
+        running_states = cls.get_running_states(job_roots)
+        for job_root in job_roots:
+            process = cls.load_running(
+                job_root, running_state=running_states.get(job_root),
+                **kwargs)
+            if process is not None:
+                old_process = running.get(process.id_)
+                if old_process is not None:
+                    old_process.stop()
+                running[process.id_] = process
         return running
 
     @classmethod
-    def load_running(cls, root: Path, **kwargs) -> Optional['CrawlProcess']:
+    def get_running_states(cls, roots: List[Path]) -> Dict[Path, bool]:
+        """ Return a dictionary telling if crawls in job directories
+        are running, checking them all at once. Directories missing from it
+        are checked one by one in load_running.
+        """
+        return {}
+
+    @classmethod
+    def load_running(cls, root: Path, running_state: Optional[bool]=None,
+                     **kwargs) -> Optional['CrawlProcess']:
         """ Initialize a process from a directory.
+        running_state is the result of get_running_states for this directory,
+        if known.
         """
         raise NotImplementedError
 
@@ -131,10 +192,13 @@ class CrawlProcess:
 class JsonLinesFollower:
     """ Follow json lines file contents: iteration allows to read all new items
     since last iteration.
+    If tail_bytes is given, the first read starts that many bytes before
+    the end of the file, which is enough if only the last items are needed.
     """
-    def __init__(self, path: Path, encoding='utf8'):
+    def __init__(self, path: Path, encoding='utf8', tail_bytes: int=None):
         self.path = path
         self.encoding = encoding
+        self.tail_bytes = tail_bytes
         self._pos = 0
         self._last_item = None
 
@@ -143,21 +207,30 @@ class JsonLinesFollower:
         If at_least_last is True, always try to return at least one item -
         if there are no new items, yield the last item.
         """
-        with self.path.open('rb') as f:
-            f.seek(self._pos)
-            line = ''
-            any_read = False
-            last_read = True
-            for line in f:
-                try:
-                    self._last_item = json.loads(line.decode(self.encoding))
-                except Exception:
-                    last_read = False
+        any_read = False
+        size = self.path.stat().st_size
+        if size != self._pos:  # else nothing was appended since the last read
+            with self.path.open('rb') as f:
+                if (self._pos == 0 and self.tail_bytes is not None and
+                        size > self.tail_bytes):
+                    # Start one byte earlier: if it's a newline,
+                    # readline skips only it and no complete line is lost.
+                    f.seek(size - self.tail_bytes - 1)
+                    f.readline()  # skip incomplete line
                 else:
-                    last_read = any_read = True
-                    yield self._last_item
-            self._pos = f.tell()
-            if not last_read:
-                self._pos -= len(line)
+                    f.seek(self._pos)
+                line = ''
+                last_read = True
+                for line in f:
+                    try:
+                        self._last_item = json.loads(line.decode(self.encoding))
+                    except Exception:
+                        last_read = False
+                    else:
+                        last_read = any_read = True
+                        yield self._last_item
+                self._pos = f.tell()
+                if not last_read:
+                    self._pos -= len(line)
         if at_least_last and not any_read and self._last_item is not None:
             yield self._last_item
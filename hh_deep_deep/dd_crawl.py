@@ -5,11 +5,12 @@ from pathlib import Path
 import re
 import math
 import multiprocessing
-import subprocess
 from typing import Any, Dict, Optional
 
-from .crawl_utils import JsonLinesFollower
-from .dd_utils import BaseDDPaths, BaseDDCrawlerProcess, is_running
+from .crawl_utils import (
+    JsonLinesFollower, read_seeds, write_seeds)
+from .dd_utils import (
+    BaseDDPaths, BaseDDCrawlerProcess, compose_call, is_running)
 from .deepdeep_crawl import DEFAULT_TRAINER_PAGE_LIMIT
 
 
@@ -25,32 +26,36 @@ class DDCrawlerProcess(BaseDDCrawlerProcess):
     crawler_name = 'deepdeep'
 
     def __init__(self, *,
-                 page_clf_data: bytes,
-                 link_clf_data: bytes,
+                 page_clf_data: bytes=None,
+                 link_clf_data: bytes=None,
                  broadness: str='BROAD',
                  **kwargs):
         super().__init__(**kwargs)
-        self.page_clf_data = page_clf_data
-        self.link_clf_data = link_clf_data
+        # None if already written to self.paths
+        self._page_clf_data = page_clf_data
+        self._link_clf_data = link_clf_data
         self.broadness = broadness
 
     @classmethod
-    def load_running(cls, root: Path, **kwargs) -> Optional['DDCrawlerProcess']:
+    def load_running(cls, root: Path, running_state: Optional[bool]=None,
+                     **kwargs) -> Optional['DDCrawlerProcess']:
         """ Initialize a process from a directory.
         """
         paths = cls.paths_cls(root)
-        if not all(p.exists() for p in [paths.pid, paths.meta, paths.seeds,
-                                        paths.page_clf, paths.link_clf]):
+        names = paths.existing_names()
+        if not all(p.name in names for p in [
+                paths.pid, paths.meta, paths.seeds,
+                paths.page_clf, paths.link_clf]):
             return
-        if not is_running(paths.root):
+        if running_state is None:
+            running_state = is_running(paths.root)
+        if not running_state:
             logging.warning('Cleaning up job in {}.'.format(paths.root))
-            subprocess.check_call(
-                ['docker-compose', 'down', '-v'], cwd=str(paths.root))
+            compose_call(paths.root, 'down', '-v')
             paths.pid.unlink()
             return
-        with paths.seeds.open('rt', encoding='utf8') as f:
-            seeds = [line.strip() for line in f]
-        if paths.login_credentials.exists():
+        seeds = read_seeds(paths.seeds)
+        if paths.login_credentials.name in names:
             with paths.login_credentials.open('rt', encoding='utf8') as f:
                 login_credentials = json.load(f)
         else:
@@ -61,8 +66,6 @@ class DDCrawlerProcess(BaseDDCrawlerProcess):
             workspace_id=meta['workspace_id'],
             seeds=seeds,
             login_credentials=login_credentials,
-            page_clf_data=paths.page_clf.read_bytes(),
-            link_clf_data=paths.link_clf.read_bytes(),
             root=root,
             **kwargs)
 
@@ -72,12 +75,12 @@ class DDCrawlerProcess(BaseDDCrawlerProcess):
             'id': self.id_,
             'workspace_id': self.workspace_id,
         }), encoding='utf8')
-        self.paths.page_clf.write_bytes(self.page_clf_data)
-        self.paths.link_clf.write_bytes(self.link_clf_data)
+        self.paths.page_clf.write_bytes(self._page_clf_data)
+        self.paths.link_clf.write_bytes(self._link_clf_data)
+        self._page_clf_data = self._link_clf_data = None
         # Create out/media beforehand to prevent a race condition
         self.paths.out.joinpath('media').mkdir(parents=True)
-        self.paths.seeds.write_text(
-            '\n'.join(url for url in self.seeds), encoding='utf8')
+        write_seeds(self.paths.seeds, self.seeds)
         with self.paths.login_credentials.open('wt', encoding='utf8') as f:
             json.dump(self.login_credentials, f)
         n_processes = multiprocessing.cpu_count()
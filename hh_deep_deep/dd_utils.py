@@ -6,10 +6,11 @@ import logging
 from pathlib import Path
 import re
 import subprocess
-from typing import Dict
+from typing import Dict, List
 
 from .crawl_utils import (
-    CrawlPaths, CrawlProcess, gen_job_path, JsonLinesFollower, get_domain)
+    CrawlPaths, CrawlProcess, docker_client, gen_job_path, JsonLinesFollower,
+    get_domain)
 
 
 class BaseDDPaths(CrawlPaths):
@@ -53,6 +54,15 @@ class BaseDDCrawlerProcess(CrawlProcess):
             self._login_cred_ids[get_domain(c['url'])] = c['id']
         self._login_state = {}  # type: Dict[str, str]
 
+    @classmethod
+    def get_running_states(cls, roots: List[Path]) -> Dict[Path, bool]:
+        started_roots = []
+        for root in roots:
+            paths = cls.paths_cls(root)
+            if paths.pid.name in paths.existing_names():
+                started_roots.append(root)
+        return get_running_states(started_roots)
+
     def is_running(self):
         return is_running(self.paths.root)
 
@@ -93,8 +103,7 @@ class BaseDDCrawlerProcess(CrawlProcess):
 
     def _scrapy_command(self, command, *args):
         # Find which crawler is still alive (some might finish earlier)
-        ps_output = subprocess.check_output(
-            ['docker-compose', 'ps'], cwd=str(self.paths.root))
+        ps_output = compose_output(self.paths.root, 'ps')
         ps_output = ps_output.decode('ascii', 'replace')
         index = '1'
         for line in ps_output.split('\n'):
@@ -108,26 +117,50 @@ class BaseDDCrawlerProcess(CrawlProcess):
             '-s', 'REDIS_HOST=redis', '-s', 'LOG_LEVEL=WARNING')
 
     def _compose_call(self, *args):
-        subprocess.check_call(
-            ['docker-compose'] + list(args), cwd=str(self.paths.root))
+        compose_call(self.paths.root, *args)
+
+
+# File descriptors opened by python are not inherited (PEP 446),
+# so close_fds is not needed: it can be slow with a high nofile limit,
+# as all possible descriptors might be closed one by one.
+
+def compose_call(root: Path, *args) -> None:
+    """ Run docker-compose command in root.
+    """
+    subprocess.check_call(
+        ['docker-compose'] + list(args), cwd=str(root), close_fds=False)
+
+
+def compose_output(root: Path, *args) -> bytes:
+    """ Run docker-compose command in root, returning its output.
+    """
+    return subprocess.check_output(
+        ['docker-compose'] + list(args), cwd=str(root), close_fds=False)
 
 
 def is_running(root: Path) -> bool:
-    running_containers = list(filter(
-        None,
-        subprocess
-        .check_output(['docker-compose', 'ps', '-q'], cwd=str(root))
-        .decode('utf8').strip().split('\n')))
-    crawl_running = 0  # only really running crawlers
-    for cid in running_containers:
-        try:
-            output = json.loads(subprocess.check_output(
-                ['docker', 'inspect', cid]).decode('utf-8'))
-        except (subprocess.CalledProcessError, ValueError):
-            pass
-        else:
-            if len(output) == 1:
-                meta = output[0]
-                if 'crawler' in meta.get('Name', ''):
-                    crawl_running += meta.get('State', {}).get('Running')
-    return crawl_running > 0
+    return get_running_states([root])[root]
+
+
+def get_running_states(roots: List[Path]) -> Dict[Path, bool]:
+    """ Check if there are running crawlers in each of compose projects
+    in roots, with a single request to docker for all of them.
+    """
+    container_roots = {}  # type: Dict[str, Path]
+    for root in roots:
+        output = compose_output(root, 'ps', '-q')
+        for cid in output.decode('utf8').split():
+            container_roots[cid] = root
+    states = {root: False for root in roots}
+    if container_roots:
+        # only running containers are listed without all=True
+        for container in docker_client().api.containers(
+                filters={'id': list(container_roots)}):
+            root = container_roots.get(container['Id'])
+            # Names also include link aliases of other containers,
+            # e.g. /<project>_crawler_1/redis, so match by compose service.
+            service = (container.get('Labels') or {}).get(
+                'com.docker.compose.service')
+            if root is not None and service == 'crawler':
+                states[root] = True
+    return states
@@ -4,12 +4,12 @@ import logging
 from pathlib import Path
 import math
 import multiprocessing
-import subprocess
 import time
 from typing import Any, Dict, Optional, List, Tuple, Set
 
-from .crawl_utils import JsonLinesFollower, get_domain
-from .dd_utils import BaseDDCrawlerProcess, is_running
+from .crawl_utils import (
+    JsonLinesFollower, get_domain, read_seeds, write_seeds)
+from .dd_utils import BaseDDCrawlerProcess, compose_call, is_running
 
 
 class DeepCrawlerProcess(BaseDDCrawlerProcess):
@@ -40,21 +40,24 @@ class DeepCrawlerProcess(BaseDDCrawlerProcess):
 
     @classmethod
     def load_running(
-            cls, root: Path, **kwargs) -> Optional['DeepCrawlerProcess']:
+            cls, root: Path, running_state: Optional[bool]=None,
+            **kwargs) -> Optional['DeepCrawlerProcess']:
         """ Initialize a process from a directory.
         """
         paths = cls.paths_cls(root)
-        if not all(p.exists() for p in [paths.pid, paths.meta, paths.seeds]):
+        names = paths.existing_names()
+        if not all(p.name in names
+                   for p in [paths.pid, paths.meta, paths.seeds]):
             return
-        if not is_running(paths.root):
+        if running_state is None:
+            running_state = is_running(paths.root)
+        if not running_state:
             logging.warning('Cleaning up job in {}.'.format(paths.root))
-            subprocess.check_call(
-                ['docker-compose', 'down', '-v'], cwd=str(paths.root))
+            compose_call(paths.root, 'down', '-v')
             paths.pid.unlink()
             return
-        with paths.seeds.open('rt', encoding='utf8') as f:
-            seeds = [line.strip() for line in f]
-        if paths.login_credentials.exists():
+        seeds = read_seeds(paths.seeds)
+        if paths.login_credentials.name in names:
             with paths.login_credentials.open('rt', encoding='utf8') as f:
                 login_credentials = json.load(f)
         else:
@@ -74,8 +77,7 @@ class DeepCrawlerProcess(BaseDDCrawlerProcess):
             'id': self.id_,
             'workspace_id': self.workspace_id,
         }), encoding='utf8')
-        self.paths.seeds.write_text(
-            '\n'.join(url for url in self.seeds), encoding='utf8')
+        write_seeds(self.paths.seeds, self.seeds)
         with self.paths.login_credentials.open('wt', encoding='utf8') as f:
             json.dump(self.login_credentials, f)
         n_processes = multiprocessing.cpu_count()
@@ -1,15 +1,18 @@
 from collections import deque
-import csv
 import json
 import logging
+import os
 from pathlib import Path
 import re
-import subprocess
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
+
+import docker.errors
+from docker.utils import version_gte
 
 from .crawl_utils import (
-    CrawlPaths, CrawlProcess, gen_job_path, JsonLinesFollower)
+    CrawlPaths, CrawlProcess, docker_client, gen_job_path, JsonLinesFollower,
+    read_seeds, write_seeds)
 from .dd_utils import DEFAULT_CRAWLER_PAGE_LIMIT
 
 
@@ -22,6 +25,8 @@ class DeepDeepPaths(CrawlPaths):
 
 DEFAULT_TRAINER_PAGE_LIMIT = 10000
 
+_Q_RE = re.compile(r'Q-(\d+)\.joblib$')
+
 
 class DeepDeepProcess(CrawlProcess):
     id_field = 'workspace_id'
@@ -29,44 +34,71 @@ class DeepDeepProcess(CrawlProcess):
     path_cls = DeepDeepPaths
 
     def __init__(self, *,
-                 page_clf_data: bytes,
+                 page_clf_data: bytes=None,
                  pid: str=None,
                  root: Path=None,
                  start_time: float=None,
                  checkpoint_interval: int=1000,
                  crawler_params: Dict=None,
+                 mem_limit: str=None,
+                 cpus: float=None,
                  **kwargs):
         super().__init__(**kwargs)
         self.pid = pid
+        self.mem_limit = mem_limit  # in docker format, e.g. "8g"
+        self.cpus = cpus
         self.page_limit = self.page_limit or DEFAULT_TRAINER_PAGE_LIMIT
         self.crawler_params = crawler_params
         self.paths = self.path_cls(
             root or gen_job_path(self.id_, self.jobs_root))
-        self.log_follower = JsonLinesFollower(self.paths.items)
-        self.page_clf_data = page_clf_data
+        # only the last items are used, no need to read the whole file
+        # after a restart
+        self.log_follower = JsonLinesFollower(
+            self.paths.items, tail_bytes=64 * 1024)
+        # None if already written to self.paths.page_clf
+        self._page_clf_data = page_clf_data
         self.checkpoint_interval = checkpoint_interval
         self.start_time = start_time
 
     @classmethod
-    def load_running(cls, root: Path, **kwargs) -> Optional['DeepDeepProcess']:
+    def get_running_states(cls, roots: List[Path]) -> Dict[Path, bool]:
+        roots_by_pid = {}
+        for root in roots:
+            try:
+                roots_by_pid[cls.path_cls(root).pid.read_text()] = root
+            except FileNotFoundError:
+                pass
+        if not roots_by_pid:
+            return {}
+        # only running containers are listed without all=True
+        running_pids = {c['Id'] for c in docker_client().api.containers(
+            filters={'id': list(roots_by_pid)})}
+        return {root: pid in running_pids
+                for pid, root in roots_by_pid.items()}
+
+    @classmethod
+    def load_running(cls, root: Path, running_state: Optional[bool]=None,
+                     **kwargs) -> Optional['DeepDeepProcess']:
         """ Initialize a process from a directory.
         """
         paths = cls.path_cls(root)
-        if not all(p.exists() for p in [
+        names = paths.existing_names()
+        if not all(p.name in names for p in [
                 paths.pid, paths.meta, paths.seeds, paths.page_clf]):
             return
 
         meta = json.loads(paths.meta.read_text('utf8'))
         pid = paths.pid.read_text()
-        if not cls._is_running(pid):
+        if running_state is None:
+            running_state = cls._is_running(pid)
+        if not running_state:
             paths.pid.unlink()
             try:
-                subprocess.check_output(['docker', 'rm', pid])
-            except subprocess.CalledProcessError:
+                docker_client().api.remove_container(pid, force=True)
+            except docker.errors.APIError:
                 pass
             return
-        with paths.seeds.open('rt', encoding='utf8') as f:
-            seeds = [url for url, in csv.reader(f)]
+        seeds = read_seeds(paths.seeds)
         return cls(
             pid=pid,
             id_=meta['id'],
@@ -74,20 +106,25 @@ class DeepDeepProcess(CrawlProcess):
             crawler_params=meta['crawler_params'],
             start_time=meta['start_time'],
             seeds=seeds,
-            page_clf_data=paths.page_clf.read_bytes(),
             root=root,
             **kwargs)
 
+    @property
+    def page_clf_data(self) -> bytes:
+        """ Page classifier data, read from the job directory
+        once the crawl is started, so that it's not kept in memory.
+        """
+        if self._page_clf_data is not None:
+            return self._page_clf_data
+        return self.paths.page_clf.read_bytes()
+
     @staticmethod
     def _is_running(pid):
         try:
-            inspect_result = json.loads(subprocess.check_output(
-                ['docker', 'inspect', pid]).decode('utf8'))
-        except subprocess.CalledProcessError:
+            container = docker_client().containers.get(pid)
+        except docker.errors.NotFound:
             return False
-        assert len(inspect_result) == 1
-        state = inspect_result[0]['State']
-        return bool(state.get('Running'))
+        return bool(container.attrs['State'].get('Running'))
 
     def is_running(self):
         return self.pid is not None and self._is_running(self.pid)
@@ -95,25 +132,22 @@ class DeepDeepProcess(CrawlProcess):
     def start(self):
         assert self.pid is None
         self.paths.mkdir()
-        self.paths.page_clf.write_bytes(self.page_clf_data)
-        with self.paths.seeds.open('wt', encoding='utf8') as f:
-            csv.writer(f).writerows([url] for url in self.seeds)
-        docker_args = [
-            'docker', 'run', '-d',
-            '-v', '{}:{}'.format(self.to_host_path(self.paths.root), '/job'),
-            '-v', '{}:{}'.format(
-                self.to_host_path(self.paths.models), '/models'),
-            '--network', 'bridge',
-        ]
+        self.paths.page_clf.write_bytes(self._page_clf_data)
+        self._page_clf_data = None
+        write_seeds(self.paths.seeds, self.seeds)
+        volumes = {
+            str(self.to_host_path(self.paths.root)):
+                {'bind': '/job', 'mode': 'rw'},
+            str(self.to_host_path(self.paths.models)):
+                {'bind': '/models', 'mode': 'rw'},
+        }
         proxy = 'http://proxy:8118'
+        links = {}
         if self.proxy_container:
-            docker_args.extend(
-                ['--link', '{}:proxy'.format(self.proxy_container)])
+            links[self.proxy_container] = 'proxy'
         if self.test_server_container:
-            docker_args.extend(
-                ['--link', '{}:test-server'.format(self.test_server_container)])
-        docker_args.append(self.docker_image)
-        args = docker_args + [
+            links[self.test_server_container] = 'test-server'
+        args = [
             'scrapy', 'crawl', 'relevant',
             '-a', 'seeds_url=/job/{}'.format(self.paths.seeds.name),
             '-a', 'checkpoint_path=/job',
@@ -131,8 +165,27 @@ class DeepDeepProcess(CrawlProcess):
                 '-s', 'HTTP_PROXY={}'.format(proxy),
                 '-s', 'HTTPS_PROXY={}'.format(proxy),
             ])
+        client = docker_client()
+        container_kwargs = {}
+        if version_gte(client.api.api_version, '1.25'):
+            # reap zombie processes in the container
+            container_kwargs['init'] = True
+        if self.mem_limit:
+            container_kwargs['mem_limit'] = self.mem_limit
+        if self.cpus:
+            container_kwargs['cpu_period'] = 100000
+            container_kwargs['cpu_quota'] = int(self.cpus * 100000)
         logging.info('Starting crawl in {}'.format(self.paths.root))
-        self.pid = subprocess.check_output(args).decode('utf8').strip()
+        container = client.containers.run(
+            self.docker_image, args,
+            detach=True,
+            volumes=volumes,
+            network_mode='bridge',
+            links=links,
+            log_config={'type': 'json-file',
+                        'config': {'max-size': '50m', 'max-file': '3'}},
+            **container_kwargs)
+        self.pid = container.id
         self.start_time = time.time()
         self.paths.meta.write_text(json.dumps({
             'id': self.id_,
@@ -145,30 +198,28 @@ class DeepDeepProcess(CrawlProcess):
 
     def stop(self, verbose=False):
         assert self.pid is not None
+        api = docker_client().api
         if verbose:
             try:
-                subprocess.check_output(
-                    ['docker', 'logs', '--tail', '30', self.pid])
-            except subprocess.CalledProcessError:
-                pass  # might be dead already
+                logging.info('Last container logs:\n{}'.format(
+                    api.logs(self.pid, tail=30).decode('utf8', 'replace')))
+            except docker.errors.APIError:
+                pass  # might be removed already
         try:
-            subprocess.check_output(['docker', 'stop', self.pid])
-        except subprocess.CalledProcessError:
-            pass  # might be dead already
-        logging.info('Crawl stopped, removing container')
-        try:
-            subprocess.check_call(['docker', 'rm', self.pid])
-        except subprocess.CalledProcessError:
+            api.remove_container(self.pid, force=True)
+        except docker.errors.APIError:
             pass  # might be removed already
         self.paths.pid.unlink()
         logging.info('Removed container id {}'.format(self.pid))
         self.pid = None
 
     def _get_updates(self) -> Dict[str, Any]:
-        if not self.paths.items.exists():
-            return {'progress': 'Crawl is not running yet'}
         n_last = self.get_n_last()
-        last_items = deque(self.log_follower.get_new_items(), maxlen=n_last)
+        try:
+            last_items = deque(
+                self.log_follower.get_new_items(), maxlen=n_last)
+        except FileNotFoundError:  # saves a separate exists() check
+            return {'progress': 'Crawl is not running yet'}
         if last_items:
             last_item = last_items[-1]
             progress = get_progress_from_item(last_item)
@@ -191,15 +242,29 @@ class DeepDeepProcess(CrawlProcess):
     def get_model(self) -> Optional[bytes]:
         """ Return a data of the last model (if there is any), or None.
         """
-        model_files = sorted(
-            self.paths.root.glob('Q-*.joblib'),
-            key=lambda p: int(re.match(r'Q-(\d+)\.joblib', p.name).groups()[0])
-        )
-        if model_files:
-            model_file = model_files[-1]
+        model_file = self._get_last_model_file()
+        if model_file is not None:
             logging.info('Reading model from {}'.format(model_file))
             return model_file.read_bytes()
 
+    def _get_last_model_file(self) -> Optional[Path]:
+        """ Return path to the model with the largest checkpoint number.
+        """
+        model_file = None
+        last_n = -1
+        try:
+            entries = list(os.scandir(str(self.paths.root)))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            m = _Q_RE.match(entry.name)
+            if m:
+                n = int(m.group(1))
+                if n > last_n:
+                    last_n = n
+                    model_file = Path(entry.path)
+        return model_file
+
 
 def is_trainer_started_by_crawler(process):
     return (isinstance(process, DeepDeepProcess) and
@@ -1,36 +1,42 @@
 import argparse
 import base64
+import binascii
+from collections import Counter
 import concurrent.futures
 import gzip
 import hashlib
 import logging
 import json
 from pathlib import Path
+import queue
+import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Set, Tuple
 import zlib
 
 import pykafka
 from pykafka.common import OffsetType
 
-from .crawl_utils import CrawlProcess, get_domain
+from .crawl_utils import CrawlProcess, docker_client, get_domain
 from .deepdeep_crawl import DeepDeepProcess, is_trainer_started_by_crawler
 from .dd_crawl import DDCrawlerProcess
 from .deep_crawl import DeepCrawlerProcess
-from .utils import configure_logging, log_ignore_exception
+from .utils import (
+    configure_logging, log_ignore_exception, json_dumps, json_loads)
 
 
 class Service:
     queue_prefix = ''
     jobs_prefix = ''
     max_message_size = 104857600
+    producer_linger_ms = 100
     group_id = 'hh-deep-deep-{}'
     reset_to_last = False
 
     def __init__(self,
                  queue_kind: str,
                  kafka_host: str=None,
-                 check_updates_every: int=30,
+                 check_updates_every: float=3,
                  debug: bool=False,
                  **crawler_process_kwargs):
         # some config depending on the queue kind
@@ -60,7 +66,8 @@ class Service:
             kafka_kwargs['hosts'] = '{}:9092'.format(kafka_host)
         self.kafka_client = pykafka.KafkaClient(**kafka_kwargs)
 
-        # Together with consumer_timeout_ms, this defines responsiveness.
+        # Interval between update checks in seconds, independent of how
+        # often messages arrive.
         self.check_updates_every = check_updates_every
         self.debug = debug
 
@@ -69,7 +76,8 @@ class Service:
         logging.info('Listening on {} topic'.format(self.input_topic))
         C = self._kafka_consumer
         P = self._kafka_producer
-        self.consumer = C(self.input_topic, consumer_timeout_ms=100)
+        # This defines how often the service wakes up when idle.
+        self.consumer = C(self.input_topic, consumer_timeout_ms=1000)
         self.progress_producer = P(self.output_topic('progress'))
         self.pages_producer = P(self.output_topic('pages'))
         if self.outputs_model:
@@ -84,6 +92,18 @@ class Service:
             self.login_output_producer = P(topic('dd-login-input'))
             self.login_result_producer = P(topic('dd-login-result'))
 
+        # Trainer containers are watched via docker events: this makes
+        # send_updates cheaper, and is started before loading running crawls
+        # so that no events are missed.
+        self._stopped_containers = queue.Queue()  # type: queue.Queue
+        self._stopped_pids = set()  # type: Set[str]
+        self._container_watcher = None  # type: Optional[threading.Thread]
+        if issubclass(self.process_class, DeepDeepProcess):
+            self._container_watcher = threading.Thread(
+                target=self._watch_containers, args=(int(time.time()),),
+                daemon=True)
+            self._container_watcher.start()
+
         self.crawler_process_kwargs = dict(
             crawler_process_kwargs,
             jobs_root=get_jobs_root(queue_kind, self.jobs_prefix))
@@ -97,6 +117,12 @@ class Service:
             logging.info('No crawls running')
 
         self.previous_progress = {}  # type: Dict[CrawlProcess, Dict[str, Any]]
+        # Checking processes is mostly waiting for IO, so it's done
+        # concurrently. Kafka messages are sent only from the calling thread.
+        self._updates_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=8)
+        # number of messages sent without waiting for delivery, per producer
+        self._pending_reports = Counter()  # type: Dict[pykafka.Producer, int]
 
     def _kafka_topic(self, topic: str) -> pykafka.Topic:
         return self.kafka_client.topics[topic.encode('ascii')]
@@ -120,53 +146,77 @@ class Service:
             ))
 
     def _kafka_producer(self, topic: str) -> pykafka.Producer:
-        return self._kafka_topic(topic).get_sync_producer(
+        # Messages are batched and sent in the background,
+        # delivery is checked in self.flush
+        return self._kafka_topic(topic).get_producer(
+            delivery_reports=True,
+            linger_ms=self.producer_linger_ms,
             max_request_size=self.max_message_size)
 
     def run(self) -> None:
-        counter = 0
         updates_futures = []
+        next_update = time.monotonic() + self.check_updates_every
         with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
             while True:
-                counter += 1
-                for value in self._read_consumer(self.consumer):
+                submitted = False
+                for value in self._read_consumer(
+                        self.consumer, deadline=next_update):
                     if value == {'from-tests': 'stop'}:
                         logging.info('Got message to stop (from tests)')
+                        executor.submit(self.flush)
                         return
                     elif all(value.get(key) is not None
                              for key in self.required_keys):
                         executor.submit(self.start_crawl, value)
+                        submitted = True
                     elif 'id' in value and value.get('stop'):
                         executor.submit(self.stop_crawl, value)
+                        submitted = True
                     else:
                         logging.error(
-                            'Dropping a message in unknown format: {}'
-                            .format(value.keys() if hasattr(value, 'keys')
-                                    else type(value)))
+                            'Dropping a message in unknown format: {}'.format(
+                                sorted(value)[:20] if isinstance(value, dict)
+                                else type(value)))
+                        logging.debug('Dropped message: %r', value)
                 for value in list(self.delayed_requests.values()):
                     executor.submit(self.start_crawl, value, delayed=True)
+                    submitted = True
                 if self.supports_login:
                     for value in self._read_consumer(self.login_consumer):
                         executor.submit(self.handle_login, value)
-                if counter % self.check_updates_every == 0:
+                        submitted = True
+                if submitted:
+                    executor.submit(self.flush)
+                if time.monotonic() >= next_update:
+                    next_update = time.monotonic() + self.check_updates_every
                     updates_futures = [f for f in updates_futures
                                        if not f.done()]
                     if not updates_futures:
                         updates_futures.append(
                             executor.submit(self.send_updates))
 
-    def _read_consumer(self, consumer: pykafka.SimpleConsumer):
+    def _read_consumer(self, consumer: pykafka.SimpleConsumer,
+                       deadline: float=None):
+        """ Yield decoded messages from consumer until it times out,
+        or until time.monotonic() passes deadline under steady input.
+        """
         if consumer is None:
             return
+        any_read = False
         for message in consumer:
+            any_read = True
             self._debug_save_message(message.value, 'incoming')
             try:
-                yield json.loads(message.value.decode('utf8'))
+                yield json_loads(message.value)
             except Exception as e:
-                logging.error('Error decoding message: {}'
-                              .format(repr(message.value)),
+                # message might be large, log only its start
+                logging.error('Error decoding message of {} bytes: {!r}'
+                              .format(len(message.value), message.value[:200]),
                               exc_info=e)
-        consumer.commit_offsets()
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        if any_read:
+            consumer.commit_offsets()
 
     @log_ignore_exception
     def start_crawl(self, request: Dict, delayed=False) -> None:
@@ -256,16 +306,65 @@ class Service:
         else:
             logging.info('Crawl with id "{}" is not running'.format(id_))
 
+    @log_ignore_exception
+    def _watch_containers(self, since: int) -> None:
+        """ Put ids of stopped containers to self._stopped_containers.
+        Runs in a separate thread: if it fails, running state is checked
+        by asking docker about each process again.
+        """
+        events = docker_client().events(
+            since=since, decode=True,
+            filters={'type': 'container', 'event': ['die', 'destroy']})
+        for event in events:
+            self._stopped_containers.put(event.get('id'))
+        logging.warning('Docker events stream ended, '
+                        'checking trainer containers by polling')
+
+    def _update_stopped_pids(self):
+        while True:
+            try:
+                self._stopped_pids.add(self._stopped_containers.get_nowait())
+            except queue.Empty:
+                break
+        # keep only containers of running processes
+        self._stopped_pids &= {
+            process.pid for process in self.running.values()
+            if isinstance(process, DeepDeepProcess)}
+
+    def _is_running(self, process: CrawlProcess) -> bool:
+        if (isinstance(process, DeepDeepProcess) and
+                self._container_watcher is not None and
+                self._container_watcher.is_alive()):
+            return process.pid not in self._stopped_pids
+        return process.is_running()
+
+    def _check_process(
+            self, process: CrawlProcess) -> Tuple[bool, Optional[Dict]]:
+        """ Return if process is running, and its updates if it is.
+        Errors are logged here, so that other processes still get updates.
+        """
+        try:
+            if self._is_running(process):
+                return True, process.get_updates()
+            return False, None
+        except Exception as e:
+            logging.error('Error checking process {}'.format(process.id_),
+                          exc_info=e)
+            return True, {}
+
     @log_ignore_exception
     def send_updates(self):
-        for id_, process in list(self.running.items()):
-            is_running = process.is_running()
+        self._update_stopped_pids()
+        running = list(self.running.items())
+        checked = self._updates_pool.map(
+            self._check_process, [process for _, process in running])
+        for (id_, process), (is_running, updates) in zip(running, checked):
             if not is_running:
                 logging.warning(
                     'Crawl should be running but it\'s not, stopping.')
                 process.stop(verbose=True)
                 self.running.pop(id_)
-            updates = process.get_updates()
+                updates = process.get_updates()
             self.send_progress_update(process, updates)
             if not is_running and is_trainer_started_by_crawler(process):
                 # trainer was called by crawler and it's done training:
@@ -273,6 +372,7 @@ class Service:
                 self.send_start_crawler(process)
             if not is_running:
                 self.send_stopped_message(process)
+        self.flush()
 
     def output_topic(self, name: str) -> str:
         return output_topic(self.queue_prefix, self.queue_kind, name)
@@ -371,10 +471,26 @@ class Service:
                              cred_id=value['id'])
 
     def send(self, producer: pykafka.Producer, result: Dict):
-        message = json.dumps(result).encode('utf8')
+        message = json_dumps(result)
         self._debug_save_message(
             message, 'outgoing to {}'.format(producer._topic.name))
         producer.produce(message)
+        self._pending_reports[producer] += 1
+
+    @log_ignore_exception
+    def flush(self) -> None:
+        """ Wait until all messages are delivered, logging failures.
+        Must be called from the thread that sent the messages, as delivery
+        reports are thread-local.
+        """
+        for producer in list(self._pending_reports):
+            while self._pending_reports[producer] > 0:
+                _, exc = producer.get_delivery_report(block=True, timeout=60)
+                self._pending_reports[producer] -= 1
+                if exc is not None:
+                    logging.error('Failed to deliver a message to {}'
+                                  .format(producer._topic.name), exc_info=exc)
+            del self._pending_reports[producer]
 
     def _debug_save_message(self, message: bytes, kind: str) -> None:
         if self.debug:
@@ -405,7 +521,8 @@ def encode_model_data(data: Optional[bytes]) -> Optional[str]:
 
 def decode_model_data(data: Optional[str]) -> bytes:
     if data is not None:
-        return zlib.decompress(base64.b64decode(data))
+        # a2b_base64 accepts ascii str directly, saving a copy of the data
+        return zlib.decompress(binascii.a2b_base64(data))
 
 
 def main():
@@ -417,6 +534,10 @@ def main():
     arg('--kafka-host')
     arg('--host-root', help='Pass host ${PWD} if running in a docker container')
     arg('--max-workers', type=int, help='Only for "crawler" or "deepcrawler"')
+    arg('--mem-limit', help='Container memory limit, e.g. "8g". '
+                            'Only for "trainer" or "crawler-trainer"')
+    arg('--cpus', type=float, help='Container CPU limit. '
+                                   'Only for "trainer" or "crawler-trainer"')
     arg('--debug', action='store_true')
     arg('--proxy-container', help='proxy container name')
     args = parser.parse_args()
@@ -425,6 +546,10 @@ def main():
     cp_kwargs = {}
     if args.max_workers:
         cp_kwargs['max_workers'] = args.max_workers
+    if args.mem_limit:
+        cp_kwargs['mem_limit'] = args.mem_limit
+    if args.cpus:
+        cp_kwargs['cpus'] = args.cpus
     if args.proxy_container:
         cp_kwargs['proxy_container'] = args.proxy_container
     service = Service(
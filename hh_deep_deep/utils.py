@@ -1,5 +1,11 @@
+import json
 import logging
 
+try:
+    import orjson
+except ImportError:  # not available for older pythons
+    orjson = None
+
 
 def configure_logging():
     logging.basicConfig(
@@ -20,3 +26,19 @@ def log_ignore_exception(fn):
             logging.error('Error in {}'.format(name), exc_info=e)
 
     return deco
+
+
+def json_dumps(obj) -> bytes:
+    """ Encode obj as utf8 json, using orjson if it's installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf8')
+
+
+def json_loads(data: bytes):
+    """ Decode utf8 json, using orjson if it's installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf8'))
@@ -7,9 +7,13 @@ setup(
     packages=['hh_deep_deep'],
     include_package_data=True,
     install_requires=[
+        'docker',
         'pykafka==2.6.0',
         'tldextract',
     ],
+    extras_require={
+        'fast-json': ['orjson'],
+    },
     entry_points = {
         'console_scripts': [
             'hh-deep-deep-service=hh_deep_deep.service:main',
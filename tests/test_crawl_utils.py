@@ -0,0 +1,57 @@
+import csv
+import json
+from pathlib import Path
+
+from hh_deep_deep.crawl_utils import JsonLinesFollower, read_seeds, write_seeds
+
+
+def test_json_lines_follower(tmpdir):
+    path = Path(str(tmpdir.join('items.jl')))
+    path.write_text('{"a": 1}\n{"a": 2}\n{"a"')
+    follower = JsonLinesFollower(path)
+    assert list(follower.get_new_items()) == [{'a': 1}, {'a': 2}]
+    assert list(follower.get_new_items()) == []
+    assert list(follower.get_new_items(at_least_last=True)) == [{'a': 2}]
+    with path.open('a') as f:
+        f.write(': 3}\n')
+    assert list(follower.get_new_items()) == [{'a': 3}]
+
+
+def test_json_lines_follower_tail(tmpdir):
+    path = Path(str(tmpdir.join('items.jl')))
+    path.write_text(''.join(json.dumps({'n': i}) + '\n' for i in range(1000)))
+    follower = JsonLinesFollower(path, tail_bytes=30)
+    assert list(follower.get_new_items()) == [{'n': 998}, {'n': 999}]
+    with path.open('a') as f:
+        f.write('{"n": 1000}\n')
+    assert list(follower.get_new_items()) == [{'n': 1000}]
+
+
+def test_json_lines_follower_tail_line_boundary(tmpdir):
+    path = Path(str(tmpdir.join('items.jl')))
+    path.write_text('{"n": 998}\n{"n": 999}\n')
+    follower = JsonLinesFollower(path, tail_bytes=len('{"n": 999}\n'))
+    assert list(follower.get_new_items()) == [{'n': 999}]
+
+
+def test_seeds(tmpdir):
+    path = Path(str(tmpdir.join('seeds.txt')))
+    seeds = [
+        'http://example.com',
+        'http://example.com/a,b?q="c",d',
+        "http://example.com/it's;a=1",
+        'http://пример.рф/путь?q=%20',
+        'http://example.com/#frag ment',
+    ]
+    write_seeds(path, seeds)
+    assert read_seeds(path) == seeds
+
+
+def test_read_csv_seeds(tmpdir):
+    # seeds.txt of older trainer jobs was written as csv
+    path = Path(str(tmpdir.join('seeds.txt')))
+    seeds = ['http://example.com', 'http://example.com/a?b=c',
+             'http://example.com/a,b', 'http://example.com/?q="c"']
+    with path.open('wt', encoding='utf8') as f:
+        csv.writer(f).writerows([url] for url in seeds)
+    assert read_seeds(path) == seeds
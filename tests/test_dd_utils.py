@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from hh_deep_deep import dd_utils
+
+
+class FakeAPI:
+    def __init__(self, containers):
+        self._containers = containers
+
+    def containers(self, filters):
+        return [c for c in self._containers if c['Id'] in filters['id']]
+
+
+class FakeClient:
+    def __init__(self, containers):
+        self.api = FakeAPI(containers)
+
+
+def test_get_running_states(monkeypatch):
+    a, b = Path('/jobs/a'), Path('/jobs/b')
+    compose_ps = {a: b'a-redis\na-crawler\n', b: b'b-redis\n'}
+    containers = [
+        {'Id': 'a-redis', 'Names': ['/a_redis_1'],
+         'Labels': {'com.docker.compose.service': 'redis'}},
+        {'Id': 'a-crawler', 'Names': ['/a_crawler_1'],
+         'Labels': {'com.docker.compose.service': 'crawler'}},
+        # redis is linked from the crawler, so it also has its alias name
+        {'Id': 'b-redis', 'Names': ['/b_crawler_1/redis', '/b_redis_1'],
+         'Labels': {'com.docker.compose.service': 'redis'}},
+    ]
+    monkeypatch.setattr(
+        dd_utils, 'compose_output', lambda root, *args: compose_ps[root])
+    monkeypatch.setattr(
+        dd_utils, 'docker_client', lambda: FakeClient(containers))
+    assert dd_utils.get_running_states([a, b]) == {a: True, b: False}
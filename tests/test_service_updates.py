@@ -0,0 +1,131 @@
+from collections import Counter
+import concurrent.futures
+import itertools
+import queue
+import threading
+import time
+
+from hh_deep_deep.deepdeep_crawl import DeepDeepProcess
+from hh_deep_deep.service import Service
+
+
+class FakeProcess:
+    def __init__(self, id_, running=True, fail=False):
+        self.id_ = id_
+        self.running = running
+        self.fail = fail
+        self.stopped = False
+
+    def is_running(self):
+        return self.running
+
+    def get_updates(self):
+        if self.fail:
+            raise ValueError('broken crawl')
+        return {'progress': self.id_}
+
+    def stop(self, verbose=False):
+        self.stopped = True
+
+
+class FakeService(Service):
+    def __init__(self, processes):
+        self.running = {p.id_: p for p in processes}
+        self._updates_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2)
+        self._stopped_containers = queue.Queue()
+        self._stopped_pids = set()
+        self._container_watcher = None
+        self._pending_reports = Counter()
+        self.debug = False
+        self.sent = []
+
+    def send_progress_update(self, process, updates):
+        self.sent.append((process.id_, updates))
+
+    def send_stopped_message(self, process):
+        self.sent.append((process.id_, 'stopped'))
+
+
+def test_send_updates_error_in_one_process():
+    processes = [FakeProcess('a'), FakeProcess('b', fail=True),
+                 FakeProcess('c'), FakeProcess('d', running=False)]
+    service = FakeService(processes)
+    service.send_updates()
+    assert service.sent == [
+        ('a', {'progress': 'a'}),
+        ('b', {}),
+        ('c', {'progress': 'c'}),
+        ('d', {'progress': 'd'}),
+        ('d', 'stopped'),
+    ]
+    assert processes[3].stopped
+    assert set(service.running) == {'a', 'b', 'c'}
+
+
+class FakeTrainer(DeepDeepProcess):
+    def __init__(self, id_, pid):
+        self.id_ = id_
+        self.pid = pid
+        self.is_running_calls = 0
+
+    def is_running(self):
+        self.is_running_calls += 1
+        return True
+
+
+def test_update_stopped_pids():
+    service = FakeService([FakeTrainer('a', 'pid-a'),
+                           FakeTrainer('b', 'pid-b')])
+    for cid in ['pid-a', 'pid-other']:
+        service._stopped_containers.put(cid)
+    service._stopped_pids.add('pid-gone')
+    service._update_stopped_pids()
+    assert service._stopped_pids == {'pid-a'}
+    assert service._stopped_containers.empty()
+
+
+def test_is_running_with_watcher():
+    trainer_a = FakeTrainer('a', 'pid-a')
+    trainer_b = FakeTrainer('b', 'pid-b')
+    service = FakeService([trainer_a, trainer_b])
+    stop_watcher = threading.Event()
+    service._container_watcher = threading.Thread(target=stop_watcher.wait)
+    service._container_watcher.start()
+    try:
+        service._stopped_containers.put('pid-a')
+        service._update_stopped_pids()
+        assert not service._is_running(trainer_a)
+        assert service._is_running(trainer_b)
+        assert trainer_a.is_running_calls == trainer_b.is_running_calls == 0
+    finally:
+        stop_watcher.set()
+        service._container_watcher.join()
+    # watcher is dead: fall back to asking docker
+    assert service._is_running(trainer_a)
+    assert trainer_a.is_running_calls == 1
+
+
+class FakeMessage:
+    def __init__(self, value):
+        self.value = value
+
+
+class EndlessConsumer:
+    def __init__(self):
+        self.committed = False
+
+    def __iter__(self):
+        return (FakeMessage(b'{"n": %d}' % i) for i in itertools.count())
+
+    def commit_offsets(self):
+        self.committed = True
+
+
+def test_read_consumer_deadline():
+    service = FakeService([])
+    consumer = EndlessConsumer()
+    values = list(service._read_consumer(
+        consumer, deadline=time.monotonic() + 0.05))
+    assert values[:2] == [{'n': 0}, {'n': 1}]
+    assert consumer.committed